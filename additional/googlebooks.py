@@ -1,19 +1,91 @@
-import requests
-from typing import Dict, List
+import logging
+import orjson
+from requests.adapters import HTTPAdapter
+from requests_cache import CachedSession
+from typing import Dict, List, NamedTuple, Optional
+from urllib3.util.request import ACCEPT_ENCODING
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+class Book(NamedTuple):
+    """Flat volume record holding only the fields the Book/Price schema and the display use."""
+    google_books_id: Optional[str]
+    isbn_10: Optional[str]
+    isbn_13: Optional[str]
+    title: Optional[str]
+    subtitle: Optional[str]
+    authors: List[Dict]
+    publisher: Optional[str]
+    published_date: Optional[str]
+    description: Optional[str]
+    language: Optional[str]
+    page_count: Optional[int]
+    categories: List[str]
+    average_rating: Optional[float]
+    ratings_count: Optional[int]
+    maturity_rating: Optional[str]
+    is_ebook: bool
+    preview_link: Optional[str]
+    info_link: Optional[str]
+    canonical_volume_link: Optional[str]
+    web_reader_link: Optional[str]
+    list_price: Optional[float]
+    retail_price: Optional[float]
+    currency: Optional[str]
+    saleability: Optional[str]
+    buy_link: Optional[str]
+
+def split_author_name(author: str) -> Dict:
+    parts = author.split() if author else ()
+    return {
+        "full_name": author,
+        "first_name": parts[0] if parts else None,
+        "last_name": parts[-1] if parts else None
+    }
+
 class GoogleBooksDataCollector:
     def __init__(self, api_key: str):
         self.base_url = "https://www.googleapis.com/books/v1/volumes"
         self.api_key = api_key
+        # keep-alive session backed by a day-long on-disk cache, so re-runs skip the network
+        self.session = CachedSession(
+            "book_cache",
+            backend="sqlite",
+            expire_after=86400,
+            allowable_methods=("GET",),
+            ignored_parameters=["key"]
+        )
+        self.session.mount("https://", HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=32,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=(429, 500, 502, 503, 504),
+                # hand the last throttled/5xx response back instead of raising RetryError,
+                # so the status check below can log it and return no books
+                raise_on_status=False
+            )
+        ))
+        # ACCEPT_ENCODING adds "br" only when brotli is installed, so we never ask for
+        # an encoding urllib3 can't decode
+        self.session.headers.update({
+            "Accept-Encoding": ACCEPT_ENCODING,
+            "Accept": "application/json"
+        })
 
-    def fetch_by_isbn(self, isbn: str) -> List[Dict]:
+    def close(self):
+        self.session.close()
+
+    def fetch_by_isbn(self, isbn: str) -> List[Book]:
         return self.fetch_google_books_data(f'isbn:{isbn}')
 
-    def fetch_google_books_data(self, query: str, start_index: int = 0, max_results: int = 10) -> List[Dict]:
+    def fetch_google_books_data(self, query: str, start_index: int = 0, max_results: int = 10) -> List[Book]:
         params = {
             'q': query,
             'startIndex': start_index,
@@ -23,135 +95,92 @@ class GoogleBooksDataCollector:
             'printType': 'all'
         }
 
-        response = requests.get(self.base_url, params=params)
+        response = self.session.get(self.base_url, params=params, timeout=10)
         if response.status_code != 200:
-            print(f"Error: {response.status_code}, {response.text}")
+            logger.error("Error: %s, %s", response.status_code, response.text)
             return []
 
-        print("Fetched raw data:", response.json())
-
         books_data = []
-        data = response.json()
-        
-        for item in data.get('items', []):
+
+        # the cached session has already read the whole body, so parse it in one pass
+        for item in orjson.loads(response.content).get('items', []):
             volume_info = item.get('volumeInfo', {})
             sales_info = item.get('saleInfo', {})
             access_info = item.get('accessInfo', {})
-            search_info = item.get('searchInfo', {})
+            # bind the lookups once per item instead of resolving .get on every field
+            vg = volume_info.get
+            sg = sales_info.get
             
             identifiers = {
                 identifier.get('type'): identifier.get('identifier')
-                for identifier in volume_info.get('industryIdentifiers', [])
+                for identifier in vg('industryIdentifiers', [])
             }
 
-            print("Volume Info:", volume_info)
-            print("Sales Info:", sales_info)
-            print("Access Info:", access_info)
-            print("Search Info:", search_info)
-            print("Identifiers:", identifiers)
-
-            author_details = [{
-                "full_name": author,
-                "first_name": author.split()[0] if author else None,
-                "last_name": author.split()[-1] if author else None,
-                "birth_date": None,
-                "death_date": None,
-                "profile_url": None,
-                "biography": None,
-                "other_works": []
-            } for author in volume_info.get('authors', [])]
-
-            print("Author Details:", author_details)
-
-            book_data = {
-                "google_books_id": item.get('id'),
-                "etag": item.get('etag'),
-                "self_link": item.get('selfLink'),
-                "volume_info": {
-                    "title": volume_info.get('title'),
-                    "subtitle": volume_info.get('subtitle'),
-                    "authors": author_details,
-                    "publisher_info": {
-                        "name": volume_info.get('publisher'),
-                        "description": None,
-                        "website": None,
-                        "founded_year": None,
-                        "location": None,
-                        "imprint": None
-                    },
-                    "published_date": volume_info.get('publishedDate'),
-                    "description": volume_info.get('description'),
-                    "identifiers": identifiers,
-                    "page_count": volume_info.get('pageCount'),
-                    "dimensions": volume_info.get('dimensions'),
-                    "categories": volume_info.get('categories', []),
-                    "average_rating": volume_info.get('averageRating'),
-                    "ratings_count": volume_info.get('ratingsCount'),
-                    "language": volume_info.get('language'),
-                    "preview_link": volume_info.get('previewLink'),
-                    "info_link": volume_info.get('infoLink'),
-                    "canonical_volume_link": volume_info.get('canonicalVolumeLink')
-                },
-                "edition_info": {
-                    "name": volume_info.get('title'),
-                    "edition_number": None,
-                    "format": "ebook" if volume_info.get('isEbook', False) else "physical",
-                    "print_type": volume_info.get('printType'),
-                    "maturity_rating": volume_info.get('maturityRating'),
-                    "main_category": volume_info.get('mainCategory'),
-                    "dimensions": volume_info.get('dimensions', {}),
-                    "print_edition_isbn": identifiers.get('ISBN_13') or identifiers.get('ISBN_10'),
-                    "publication_date": volume_info.get('publishedDate'),
-                    "content_version": volume_info.get('contentVersion')
-                },
-                "price_info": {
-                    "list_price": sales_info.get('listPrice', {}),
-                    "retail_price": sales_info.get('retailPrice', {}),
-                    "saleability": sales_info.get('saleability'),
-                    "on_sale_date": sales_info.get('onSaleDate'),
-                    "currency": sales_info.get('listPrice', {}).get('currencyCode'),
-                    "country": sales_info.get('country'),
-                    "is_ebook": sales_info.get('isEbook', False),
-                    "buy_link": sales_info.get('buyLink')
-                },
-                "metadata": {
-                    "content_version": volume_info.get('contentVersion'),
-                    "allow_anon_logging": volume_info.get('allowAnonLogging', False),
-                    "language": volume_info.get('language'),
-                    "preview_link": volume_info.get('previewLink'),
-                    "info_link": volume_info.get('infoLink'),
-                    "canonical_volume_link": volume_info.get('canonicalVolumeLink'),
-                    "sample_page_count": access_info.get('samplePageCount'),
-                    "text_snippet": search_info.get('textSnippet'),
-                    "view_ability": access_info.get('viewability'),
-                    "pdf_available": access_info.get('pdf', {}).get('isAvailable', False),
-                    "pdf_link": access_info.get('pdf', {}).get('acsTokenLink'),
-                    "epub_available": access_info.get('epub', {}).get('isAvailable', False),
-                    "epub_link": access_info.get('epub', {}).get('acsTokenLink'),
-                    "web_reader_link": access_info.get('webReaderLink')
-                },
-                "reviews": volume_info.get('reviews', []),
-                "related_books": volume_info.get('relatedBooks', [])
-            }
-            print("Book Data:", book_data)
+            logger.debug("Volume Info: %s", volume_info)
+            logger.debug("Sales Info: %s", sales_info)
+            logger.debug("Access Info: %s", access_info)
+            logger.debug("Identifiers: %s", identifiers)
+
+            author_details = [split_author_name(author) for author in vg('authors', [])]
+
+            logger.debug("Author Details: %s", author_details)
+
+            list_price = sg('listPrice') or {}
+            book_data = Book(
+                google_books_id=item.get('id'),
+                isbn_10=identifiers.get('ISBN_10'),
+                isbn_13=identifiers.get('ISBN_13'),
+                title=vg('title'),
+                subtitle=vg('subtitle'),
+                authors=author_details,
+                publisher=vg('publisher'),
+                published_date=vg('publishedDate'),
+                description=vg('description'),
+                language=vg('language'),
+                page_count=vg('pageCount'),
+                categories=vg('categories', []),
+                average_rating=vg('averageRating'),
+                ratings_count=vg('ratingsCount'),
+                maturity_rating=vg('maturityRating'),
+                is_ebook=sg('isEbook', False),
+                preview_link=vg('previewLink'),
+                info_link=vg('infoLink'),
+                canonical_volume_link=vg('canonicalVolumeLink'),
+                web_reader_link=access_info.get('webReaderLink'),
+                list_price=list_price.get('amount'),
+                retail_price=(sg('retailPrice') or {}).get('amount'),
+                currency=list_price.get('currencyCode'),
+                saleability=sg('saleability'),
+                buy_link=sg('buyLink')
+            )
+            logger.debug("Book Data: %s", book_data)
             books_data.append(book_data)
         return books_data
 
     @staticmethod
-    def format_for_display(book: Dict) -> str:
-        return f"""
-        Title: {book['volume_info']['title']}
-        Subtitle: {book['volume_info']['subtitle']}
-        Authors: {', '.join([author['full_name'] for author in book['volume_info']['authors']])}
-        Publisher: {book['volume_info']['publisher_info']['name']}
-        Published: {book['volume_info']['published_date']}
-        ISBN: {book['volume_info']['identifiers']}
-        Pages: {book['volume_info']['page_count']}
-        Language: {book['volume_info']['language']}
-        Categories: {', '.join(book['volume_info']['categories'])}
-        Rating: {book['volume_info']['average_rating']} ({book['volume_info']['ratings_count']} ratings)
-        Preview: {book['metadata']['preview_link']}
-        """
+    def format_for_display(book: Book) -> str:
+        authors = ', '.join(author['full_name'] for author in book.authors)
+        categories = ', '.join(book.categories)
+        return "\n        ".join((
+            "",
+            f"Title: {book.title}",
+            f"Subtitle: {book.subtitle}",
+            f"Authors: {authors}",
+            f"Publisher: {book.publisher}",
+            f"Published: {book.published_date}",
+            f"ISBN: {book.isbn_13 or book.isbn_10}",
+            f"Pages: {book.page_count}",
+            f"Language: {book.language}",
+            f"Categories: {categories}",
+            f"Rating: {book.average_rating} ({book.ratings_count} ratings)",
+            f"Preview: {book.preview_link}",
+            ""
+        ))
+
+    @classmethod
+    def format_many(cls, books: List[Book]) -> str:
+        # one string and one print for the whole batch instead of a print per book
+        return "\n".join(map(cls.format_for_display, books))
 
 if __name__ == "__main__":
     API_KEY = os.getenv("GOOGLE_API_KEY")
@@ -160,6 +189,6 @@ if __name__ == "__main__":
         
     collector = GoogleBooksDataCollector(api_key=API_KEY)
     books = collector.fetch_by_isbn("9780590353427")
+    collector.close()
     
-    for book in books:
-        print(collector.format_for_display(book))
\ No newline at end of file
+    print(collector.format_many(books))
\ No newline at end of file
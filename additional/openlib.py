@@ -1,5 +1,30 @@
+import logging
+import orjson
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import requests
-from typing import List, Dict, Any
+from requests.adapters import HTTPAdapter
+from requests_cache import CachedSession
+from typing import List, Dict, Any, NamedTuple, Optional
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+class OpenLibraryBook(NamedTuple):
+    """Flat book record; a tuple subclass, so no per-record dict of keys."""
+    title: Optional[str]
+    subtitle: Optional[str]
+    authors: List[Dict]
+    publisher: Optional[str]
+    publish_date: Optional[str]
+    pages: Optional[int]
+    cover_url: Optional[str]
+    identifiers: Dict[str, List[str]]
+    subjects: List[str]
+    notes: Optional[str]
+    url: Optional[str]
 
 class OpenLibraryDataCollector:
     def __init__(self):
@@ -7,97 +32,184 @@ class OpenLibraryDataCollector:
         self.book_api_url = f"{self.base_url}/api/books"
         self.search_api_url = f"{self.base_url}/search.json"
         self.author_api_url = f"{self.base_url}/authors"
-        print("Initialized OpenLibraryDataCollector")
-
-    def fetch_by_isbn(self, isbn: str) -> Dict:
-        params = {
-            'bibkeys': f'ISBN:{isbn}',
-            'format': 'json',
-            'jscmd': 'data'
-        }
-        print(f"Fetching data for ISBN: {isbn}")
-        response = requests.get(self.book_api_url, params=params)
-        
-        if response.status_code != 200:
-            print(f"Error: {response.status_code}, {response.text}")
-            return {}
+        # keep-alive session shared by the book and author lookups, backed by a
+        # day-long on-disk cache so re-runs and repeated authors skip the network
+        self.session = CachedSession(
+            "book_cache",
+            backend="sqlite",
+            expire_after=86400,
+            allowable_methods=("GET",)
+        )
+        self.session.mount("https://", HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=32,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=(429, 500, 502, 503, 504),
+                # return the last failed response rather than raising RetryError
+                raise_on_status=False
+            )
+        ))
+        # the same author shows up across many ISBNs, so remember lookups per collector;
+        # only successful ones are kept, so a timed-out author is asked for again next time
+        self.author_cache: "OrderedDict[str, Dict]" = OrderedDict()
+        self.author_cache_size = 4096
+        self.author_cache_lock = threading.Lock()
+        logger.debug("Initialized OpenLibraryDataCollector")
 
-        book_data = response.json().get(f'ISBN:{isbn}', {})
-        if not book_data:
-            print(f"No data found for ISBN: {isbn}")
-            return {}
+    def close(self):
+        self.session.close()
+
+    def fetch_by_isbn(self, isbn: str) -> Optional[OpenLibraryBook]:
+        return self.fetch_books_by_isbns([isbn]).get(isbn)
+
+    def fetch_books_by_isbns(self, isbns: List[str], chunk: int = 50) -> Dict[str, OpenLibraryBook]:
+        # the books API takes many comma-separated bibkeys, so each chunk of ISBNs costs one request
+        raw_books = {}
+        for start in range(0, len(isbns), chunk):
+            params = {
+                'bibkeys': ','.join(f'ISBN:{isbn}' for isbn in isbns[start:start + chunk]),
+                'format': 'json',
+                'jscmd': 'data'
+            }
+            logger.debug("Fetching data for ISBNs: %s", params['bibkeys'])
+            try:
+                response = self.session.get(self.book_api_url, params=params, timeout=10)
+            except requests.RequestException as e:
+                logger.error("Error fetching ISBNs %s: %s", params['bibkeys'], e)
+                continue
+
+            if response.status_code != 200:
+                logger.error("Error: %s, %s", response.status_code, response.text)
+                continue
+
+            for bibkey, book_data in orjson.loads(response.content).items():
+                if book_data:
+                    raw_books[bibkey.split(':', 1)[1]] = book_data
+
+        # an author shared by several books is looked up once, with all unique lookups overlapped
+        author_ids = list(dict.fromkeys(
+            self._author_id(author)
+            for book_data in raw_books.values()
+            for author in book_data.get('authors', [])
+        ))
+        author_map = {}
+        if author_ids:
+            with ThreadPoolExecutor(max_workers=min(8, len(author_ids))) as executor:
+                author_map = dict(zip(author_ids, executor.map(self._fetch_author_info, author_ids)))
+
+        books = {}
+        for isbn, book_data in raw_books.items():
+            # one malformed record shouldn't cost the rest of the request
+            try:
+                books[isbn] = self._format_book(book_data, author_map)
+            except (AttributeError, IndexError, KeyError, TypeError) as e:
+                logger.warning("Skipping unparseable OpenLibrary record %s: %s", isbn, e)
 
-        print(f"Fetched book data: {book_data}")
-        authors_raw = book_data.get('authors', [])
+        for isbn in isbns:
+            if isbn not in books:
+                logger.info("No data found for ISBN: %s", isbn)
+        return books
+
+    @staticmethod
+    def _author_id(author: Dict) -> str:
+        return author.get('url').split('/')[-1] if author.get('url') else None
+
+    def _format_book(self, book_data: Dict, author_map: Dict[str, Dict]) -> OpenLibraryBook:
+        logger.debug("Fetched book data: %s", book_data)
         author_details = []
-        
-        for author in authors_raw:
-            author_name = author.get('name', '')
-            author_url = author.get('url', '')
-            author_id = author_url.split('/')[-1] if author_url else None
-            
-            author_info = {"name": author_name}
-            if author_id:
-                print(f"Fetching details for author: {author_name}")
-                additional_info = self.fetch_author_details(author_id)
-                if additional_info:
-                    author_info.update(additional_info)
+        for author in book_data.get('authors', []):
+            author_info = {"name": author.get('name', '')}
+            author_info.update(author_map.get(self._author_id(author), {}))
             author_details.append(author_info)
 
-        formatted_data = {
-            "title": book_data.get('title'),
-            "subtitle": book_data.get('subtitle'),
-            "authors": author_details,
-            "publisher": next((pub.get('name') for pub in book_data.get('publishers', [])), None),
-            "publish_date": book_data.get('publish_date'),
-            "pages": book_data.get('number_of_pages'),
-            "cover_url": book_data.get('cover', {}).get('large'),
-            "identifiers": book_data.get('identifiers', {}),
-            "subjects": [subject.get('name') for subject in book_data.get('subjects', [])],
-            "notes": book_data.get('notes'),
-            "url": book_data.get('url')
-        }
-
-        print(f"Formatted data for ISBN: {isbn}: {formatted_data}")
+        formatted_data = OpenLibraryBook(
+            title=book_data.get('title'),
+            subtitle=book_data.get('subtitle'),
+            authors=author_details,
+            publisher=(book_data.get('publishers') or [{}])[0].get('name'),
+            publish_date=book_data.get('publish_date'),
+            pages=book_data.get('number_of_pages'),
+            cover_url=book_data.get('cover', {}).get('large'),
+            identifiers=book_data.get('identifiers', {}),
+            # subject names repeat heavily across books, so keep one string object per name
+            subjects=[
+                sys.intern(name) for name in (subject.get('name') for subject in book_data.get('subjects') or ())
+                if isinstance(name, str)
+            ],
+            notes=book_data.get('notes'),
+            url=book_data.get('url')
+        )
+
+        logger.debug("Formatted data: %s", formatted_data)
         return formatted_data
 
+    def _fetch_author_info(self, author_id: str) -> Dict:
+        if not author_id:
+            return {}
+        logger.debug("Fetching details for author: %s", author_id)
+        return self.fetch_author_details(author_id)
+
     def fetch_author_details(self, author_id: str) -> Dict:
+        with self.author_cache_lock:
+            if author_id in self.author_cache:
+                self.author_cache.move_to_end(author_id)
+                return self.author_cache[author_id]
+
         url = f"{self.author_api_url}/{author_id}.json"
-        print(f"Fetching author details from URL: {url}")
+        logger.debug("Fetching author details from URL: %s", url)
         try:
-            response = requests.get(url)
+            response = self.session.get(url, timeout=10)
             if response.status_code == 200:
-                data = response.json()
-                print(f"Fetched author details: {data}")
-                return {
+                data = orjson.loads(response.content)
+                logger.debug("Fetched author details: %s", data)
+                details = {
                     "birth_date": data.get("birth_date"),
                     "death_date": data.get("death_date"),
                     "bio": data.get("bio", {}).get("value") if isinstance(data.get("bio"), dict) else data.get("bio"),
                     "wikipedia_url": data.get("wikipedia")
                 }
+                with self.author_cache_lock:
+                    self.author_cache[author_id] = details
+                    if len(self.author_cache) > self.author_cache_size:
+                        self.author_cache.popitem(last=False)
+                return details
         except Exception as e:
-            print(f"Error fetching author details: {e}")
+            logger.error("Error fetching author details: %s", e)
         return {}
 
     @staticmethod
-    def format_for_display(book: Dict) -> str:
+    def format_for_display(book: Optional[OpenLibraryBook]) -> str:
         if not book:
             return "No book data found"
             
-        author_names = [author.get('name', 'Unknown') for author in book.get('authors', [])]
-        return f"""
-        Title: {book.get('title', 'N/A')}
-        Subtitle: {book.get('subtitle', 'N/A')}
-        Authors: {', '.join(author_names)}
-        Publisher: {book.get('publisher', 'N/A')}
-        Published: {book.get('publish_date', 'N/A')}
-        Pages: {book.get('pages', 'N/A')}
-        Subjects: {', '.join(book.get('subjects', []))}
-        ISBNs: {', '.join(f"{k}: {v}" for k, v in book.get('identifiers', {}).items())}
-        URL: {book.get('url', 'N/A')}
-        """
+        authors = ', '.join(author.get('name', 'Unknown') for author in book.authors)
+        identifiers = ', '.join(f"{k}: {v}" for k, v in book.identifiers.items())
+        return "\n        ".join((
+            "",
+            f"Title: {book.title}",
+            f"Subtitle: {book.subtitle}",
+            f"Authors: {authors}",
+            f"Publisher: {book.publisher}",
+            f"Published: {book.publish_date}",
+            f"Pages: {book.pages}",
+            f"Subjects: {', '.join(book.subjects)}",
+            f"ISBNs: {identifiers}",
+            f"URL: {book.url}",
+            ""
+        ))
+
+    @staticmethod
+    def to_json(book: Optional[OpenLibraryBook]) -> bytes:
+        # lossless machine-readable output; lists stay lists instead of being joined for display
+        return orjson.dumps(book._asdict() if book else None, option=orjson.OPT_NON_STR_KEYS)
 
 if __name__ == "__main__":
     collector = OpenLibraryDataCollector()
     book = collector.fetch_by_isbn("9780590353427")
-    print(collector.format_for_display(book))
\ No newline at end of file
+    if "--json" in sys.argv:
+        sys.stdout.buffer.write(collector.to_json(book) + b"\n")
+    else:
+        print(collector.format_for_display(book))
+    collector.close()
\ No newline at end of file
@@ -171,7 +171,10 @@ def main():
 
         print("transferring books...")
         pg_cursor.execute("""
-            SELECT b.*, r.avg_rating, r.ratings_count, 
+            SELECT b.book_id, b.isbn10, b.isbn13, b.title, b.subtitle, b.description,
+                   b.language_code, b.publication_year, b.page_count, b.maturity_rating,
+                   b.google_books_id, b.google_preview_link, b.google_info_link,
+                   b.google_canonical_link, r.avg_rating, r.ratings_count,
                    pb.format, eb.ebook_url
             FROM Book b
             LEFT JOIN Ratings r ON b.book_id = r.book_id
@@ -95,7 +95,9 @@ CREATE TABLE Book (
     google_books_id VARCHAR(50) UNIQUE,
     google_preview_link URL_TYPE,
     google_info_link URL_TYPE,
-    google_canonical_link URL_TYPE
+    google_canonical_link URL_TYPE,
+    -- parsed once on write so full-text search reads the stored vector instead of recomputing it
+    title_tsv TSVECTOR GENERATED ALWAYS AS (to_tsvector('english', title)) STORED
 );
 
 -- WEAK ENTITY
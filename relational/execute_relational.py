@@ -1,6 +1,7 @@
 import psycopg2
+from psycopg2.extras import RealDictCursor
 import time
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Union
 import os
 from dotenv import load_dotenv
 
@@ -14,69 +15,153 @@ class PostgresQuerier:
             host=host,
             port=port
         )
+        # the benchmark is read-only, so skip the implicit BEGIN/COMMIT around every query;
+        # this also lets the indexes be built CONCURRENTLY
+        self.conn.autocommit = True
+        # (query, params) -> (results, time stored), shared across passes until the indexes change
+        self.result_cache: Dict[tuple, Tuple[List[Dict[str, Any]], float]] = {}
 
     def close(self):
         """Close database connection"""
         self.conn.close()
 
-    def measure_query_time(self, query: str, params: Dict = None) -> Tuple[List[Dict[str, Any]], float]:
+    def measure_query_time(self, query: str, params: Union[Dict, tuple] = None) -> Tuple[List[Dict[str, Any]], float]:
         """Execute a query and measure its execution time"""
-        with self.conn.cursor() as cur:
-            start_time = time.time()
+        # RealDictCursor builds each row as a dict while fetching
+        with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
+            start_time = time.perf_counter_ns()
             cur.execute(query, params or {})
             try:
                 result = cur.fetchall()
             except psycopg2.ProgrammingError:
                 # For queries that don't return results (like CREATE INDEX)
                 result = []
-            execution_time = time.time() - start_time
-            
-            # Get column names for dictionary creation
-            if cur.description:
-                columns = [desc[0] for desc in cur.description]
-                return [dict(zip(columns, row)) for row in result], execution_time
-            return [], execution_time
-        
+            execution_time = (time.perf_counter_ns() - start_time) / 1e9
+            return result, execution_time
+
+    def measure_cached_query_time(self, query: str, params: Union[Dict, tuple] = None, ttl: float = 300) -> Tuple[List[Dict[str, Any]], float, bool]:
+        """Serve a query from the result cache, running it on a miss, and measure the time taken"""
+        key = (query, params if isinstance(params, tuple) else tuple(sorted((params or {}).items())))
+        start_time = time.perf_counter_ns()
+        cached = self.result_cache.get(key)
+        if cached and time.monotonic() - cached[1] < ttl:
+            return cached[0], (time.perf_counter_ns() - start_time) / 1e9, True
+        results, execution_time = self.measure_query_time(query, params)
+        self.result_cache[key] = (results, time.monotonic())
+        return results, execution_time, False
+
+    def measure_server_time(self, query: str, params: Union[Dict, tuple] = None) -> float:
+        """Run a query under EXPLAIN ANALYZE and return the planning plus execution time the server reports"""
+        with self.conn.cursor() as cur:
+            cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + query, params or {})
+            plan = cur.fetchone()[0][0]
+        return (plan["Planning Time"] + plan["Execution Time"]) / 1000.0
+
+    def check_plan(self, query: str, params: Union[Dict, tuple] = None) -> List[str]:
+        """EXPLAIN a query and raise if no node of its plan reads through an index"""
+        with self.conn.cursor() as cur:
+            cur.execute("EXPLAIN (FORMAT JSON) " + query, params or {})
+            nodes = [cur.fetchone()[0][0]["Plan"]]
+        node_types = []
+        while nodes:
+            node = nodes.pop()
+            node_types.append(node["Node Type"])
+            nodes.extend(node.get("Plans", ()))
+        if not any("Index" in node_type for node_type in node_types):
+            raise RuntimeError(f"Plan does not use an index: {', '.join(node_types)}")
+        return node_types
+
+    def prepare_queries(self, queries: Dict[str, str], query_params: Dict[str, Dict], prefix: str = "q") -> Dict[str, Tuple[str, tuple]]:
+        """PREPARE each query once and return the EXECUTE statement and arguments for it"""
+        prepared = {}
+        with self.conn.cursor() as cur:
+            for i, (name, query) in enumerate(queries.items(), start=1):
+                params = query_params.get(name) or {}
+                statement = f"{prefix}{i}"
+                # swap each %(key)s placeholder for its positional $n
+                positions = {key: f"${n}" for n, key in enumerate(params, start=1)}
+                cur.execute(f"PREPARE {statement} AS {query.strip().rstrip(';') % positions};")
+                if params:
+                    args = tuple(params.values())
+                    execute = f"EXECUTE {statement} ({', '.join(['%s'] * len(args))});"
+                else:
+                    args = ()
+                    execute = f"EXECUTE {statement};"
+                prepared[name] = (execute, args)
+        return prepared
+
     def drop_indexes(self):
-        """Drop all existing indexes"""
+        """Drop the indexes compared by the benchmark; the full-text index is kept across runs"""
         with self.conn.cursor() as cur:
             try:
                 cur.execute("""
                     DROP INDEX IF EXISTS book_year_idx;
                     DROP INDEX IF EXISTS book_lang_pages_idx;
-                    DROP INDEX IF EXISTS book_title_idx;
+                    DROP INDEX IF EXISTS book_lang_year_pages_idx;
                     DROP INDEX IF EXISTS physical_book_format_idx;
                 """)
-                self.conn.commit()
                 print("Dropped existing indexes")
             except Exception as e:
                 print(f"Error dropping indexes: {str(e)}")
 
     def create_indexes(self):
-        """Create indexes for better query performance"""
-        with self.conn.cursor() as cur:
-            
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS book_year_idx 
+        """Create indexes for better query performance, skipping any already in the catalog"""
+        indexes = {
+            "book_year_idx": """
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS book_year_idx 
                 ON Book(publication_year);
-            """)
+            """,
             
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS book_lang_pages_idx 
-                ON Book(language_code, page_count);
-            """)
+            # matches the top n query: equality on language, already sorted by year,
+            # page count filtered inside the index
+            "book_lang_year_pages_idx": """
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS book_lang_year_pages_idx 
+                ON Book(language_code, publication_year DESC, page_count);
+            """,
             
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS physical_book_format_idx
+            "physical_book_format_idx": """
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS physical_book_format_idx
                 ON PhysicalBook(format);
-            """)
+            """,
             
+            "book_title_idx": """
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS book_title_idx
+                ON Book USING gin(title_tsv);
+            """
+        }
+
+        with self.conn.cursor() as cur:
+            # databases restored from dump.sql predate the stored title vector; this is a no-op once it exists
             cur.execute("""
-                CREATE INDEX IF NOT EXISTS book_title_idx
-                ON Book USING gin(to_tsvector('english', title));
+                ALTER TABLE Book ADD COLUMN IF NOT EXISTS title_tsv TSVECTOR
+                GENERATED ALWAYS AS (to_tsvector('english', title)) STORED;
             """)
-            
-        self.conn.commit()
+
+            cur.execute("""
+                SELECT c.relname, pg_get_indexdef(i.indexrelid), i.indisvalid
+                FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = current_schema();
+            """)
+            existing = {name: (indexdef, valid) for name, indexdef, valid in cur.fetchall()}
+
+            for name in indexes:
+                if name not in existing:
+                    continue
+                indexdef, valid = existing[name]
+                # a failed CREATE INDEX CONCURRENTLY leaves an INVALID index behind under the same name;
+                # older runs built book_title_idx on to_tsvector(title), but the full text query reads title_tsv
+                if not valid or (name == "book_title_idx" and "title_tsv" not in indexdef):
+                    print(f"Rebuilding index: {name}")
+                    cur.execute(f"DROP INDEX CONCURRENTLY {name};")
+                    del existing[name]
+
+            for name, statement in indexes.items():
+                if name in existing:
+                    print(f"Index already present: {name}")
+                    continue
+                cur.execute(statement)
 
     def demonstrate_queries(self):
         """Run all query types and measure their performance"""
@@ -84,19 +169,15 @@ class PostgresQuerier:
             "basic search on attribute value": """
                 SELECT title, publication_year
                 FROM Book
-                WHERE publication_year > 2023;
-            """,
-            
-            "aggregation paperback": """
-                SELECT COUNT(*)
-                FROM PhysicalBook
-                WHERE format = 'Paperback';
+                WHERE publication_year > %(year)s;
             """,
             
-            "aggregation hardcover": """
-                SELECT COUNT(*)
+            # one scan of PhysicalBook counts every requested format
+            "aggregation by format": """
+                SELECT format, COUNT(*)
                 FROM PhysicalBook
-                WHERE format = 'Hardcover';
+                WHERE format IN (%(paperback)s, %(hardcover)s)
+                GROUP BY format;
             """,
             
             "aggregation ebook": """
@@ -107,45 +188,97 @@ class PostgresQuerier:
             "top n entities satisfying criteria": """
                 SELECT title, publication_year, language_code
                 FROM Book
-                WHERE language_code = 'en ' 
+                WHERE language_code = %(language)s 
                 AND publication_year IS NOT NULL 
-                AND page_count > 10000
+                AND page_count > %(pages)s
                 ORDER BY publication_year DESC
-                LIMIT 300;
+                LIMIT %(limit)s;
             """,
             
+            # only the most recent years are shown, so the server can stop after ten groups
             "books group by publication year": """
                 SELECT publication_year as year, COUNT(*) as number_of_books
                 FROM Book
                 WHERE publication_year IS NOT NULL
                 GROUP BY publication_year
-                ORDER BY year DESC;
+                ORDER BY year DESC
+                FETCH FIRST 10 ROWS ONLY;
             """
         }
 
+        # rank and limit the matches first, then look up authors and rating for just those rows
+        fulltext_query = {
+            "full text search": """
+                WITH top AS (
+                    SELECT book_id, title, ts_rank(title_tsv, query) AS rank
+                    FROM Book, plainto_tsquery('english', %(search_term)s) query
+                    WHERE title_tsv @@ query
+                    ORDER BY rank DESC
+                    LIMIT 5
+                )
+                SELECT t.title, t.rank,
+                       (SELECT string_agg(a.name, '; ')
+                        FROM BookAuthor ba JOIN Author a USING (author_id)
+                        WHERE ba.book_id = t.book_id) AS authors,
+                       (SELECT r.avg_rating FROM Ratings r WHERE r.book_id = t.book_id) AS avg_rating
+                FROM top t
+                ORDER BY t.rank DESC;
+            """
+        }
+
+        # literals are passed as parameters so the query text stays identical between runs
+        query_params = {
+            "basic search on attribute value": {"year": 2023},
+            "aggregation by format": {"paperback": "Paperback", "hardcover": "Hardcover"},
+            "top n entities satisfying criteria": {"language": "en ", "pages": 10000, "limit": 300},
+            "full text search": {"search_term": "python programming"}
+        }
+
+        # statements outlive the transaction, so clear any left over from an earlier run
+        with self.conn.cursor() as cur:
+            cur.execute("DEALLOCATE ALL;")
+
+        # parse once up front so the timed passes only pay for planning and execution
+        prepared = self.prepare_queries(queries, query_params)
+
         # first, drop any existing indexes
         print("\nDropping existing indexes...")
         self.drop_indexes()
     
         # test queries before creating indexes
         print("\nBefore creating indexes:")
-        self._run_queries(queries)
+        self._run_queries(prepared)
 
         # create indexes
         print("\nCreating indexes...")
         self.create_indexes()
+        # results cached before the indexes existed would hide the difference they make
+        self.result_cache.clear()
+
+        # the top n query is the one the composite index was built for, so a scan here is a regression
+        self.check_plan(*prepared["top n entities satisfying criteria"])
 
         # test queries after creating indexes
         print("\nAfter creating indexes:")
-        self._run_queries(queries)
+        self._run_queries(prepared)
+
+        # test full-text search query; the stored title vector may only exist once create_indexes has run
+        self._run_queries(self.prepare_queries(fulltext_query, query_params, prefix="fts"))
+
+        # repeat the same queries, now answered from the result cache
+        print("\nFrom the result cache:")
+        self._run_queries(prepared)
 
-    def _run_queries(self, queries: Dict[str, str]):
-        """Helper method to run queries and print results"""
-        for name, query in queries.items():
-            params = {"search_term": "python & programming"} if "full text" in name.lower() else None
-            results, execution_time = self.measure_query_time(query, params)
+    def _run_queries(self, prepared: Dict[str, Tuple[str, tuple]]):
+        """Helper method to run prepared queries and print results"""
+        for name, (execute, args) in prepared.items():
+            results, execution_time, cache_hit = self.measure_cached_query_time(execute, args)
             print(f"\n{name}:")
-            print(f"Execution time: {execution_time:.6f} seconds")
+            if cache_hit:
+                print(f"Cache hit time: {execution_time * 1e6:.1f} µs")
+            else:
+                print(f"Execution time: {execution_time * 1e6:.1f} µs")
+                print(f"Server execution time: {self.measure_server_time(execute, args) * 1e6:.1f} µs")
             print(f"Sample results: {results[:2]}")
 
 def main():
@@ -1,24 +1,143 @@
+import atexit
+import logging
+import orjson
 import random
 import string
+import sys
 import requests
+from requests.adapters import HTTPAdapter
+from requests_cache import CachedSession
 from typing import List, Dict, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+def _keep_alive_session() -> requests.Session:
+    """Create a session that keeps TCP/TLS connections to the API host open between calls."""
+    # successful GETs are kept on disk for a day, so re-runs over the same ISBNs skip the network;
+    # the API key is left out of the cache key so rotating keys still hits the same entries
+    session = CachedSession(
+        "book_cache",
+        backend="sqlite",
+        expire_after=86400,
+        allowable_methods=("GET",),
+        ignored_parameters=["key"]
+    )
+    adapter = HTTPAdapter(pool_connections=20, pool_maxsize=20, max_retries=0)
+    session.mount("https://", adapter)
+    return session
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    """Share one string object per distinct name; publishers, categories and subjects repeat across books."""
+    return sys.intern(value) if isinstance(value, str) else value
+
+_shared_session: Optional[requests.Session] = None
+_shared_session_users = 0
+_shared_session_lock = threading.Lock()
+
+def get_shared_session() -> requests.Session:
+    """Return the process-wide session shared by the API clients, creating it on first use."""
+    global _shared_session, _shared_session_users
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = _keep_alive_session()
+        _shared_session_users += 1
+        return _shared_session
+
+def release_shared_session():
+    """Drop one client's hold on the shared session, closing it once the last client lets go."""
+    global _shared_session, _shared_session_users
+    with _shared_session_lock:
+        _shared_session_users -= 1
+        if _shared_session_users <= 0 and _shared_session is not None:
+            _shared_session.close()
+            _shared_session, _shared_session_users = None, 0
+
+@atexit.register
+def _close_shared_session():
+    """Close the shared session at exit even if some client was never closed."""
+    with _shared_session_lock:
+        if _shared_session is not None:
+            _shared_session.close()
+
+class TokenBucket:
+    """Request budget that refills at a steady rate, so calls throttle themselves before the API rejects them."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.nominal_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, tokens: float = 1.0):
+        """Take tokens from the bucket, sleeping until enough have refilled."""
+        with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                time.sleep((tokens - self.tokens) / self.rate)
+
+    def slow_down(self):
+        """Halve the refill rate after the API pushes back."""
+        with self.lock:
+            self.rate = max(self.rate * 0.5, self.nominal_rate / 64)
+
+    def speed_up(self):
+        """Recover the refill rate additively after a successful call."""
+        with self.lock:
+            self.rate = min(self.rate + 0.5, self.nominal_rate)
 
 class GoogleBooksAPI:
     """Handles Google Books API interactions with extended field coverage."""
 
-    def __init__(self, api_keys: List[str]):
+    def __init__(self, api_keys: List[str], session: Optional[requests.Session] = None):
         self.base_url = "https://www.googleapis.com/books/v1/volumes"
         self.api_keys = api_keys
         self.current_key_index = 0
+        # one session for every client, so DNS, TLS sessions and sockets are shared;
+        # a session passed in stays owned by the caller
+        self.shares_session = session is None
+        self.session = session or get_shared_session()
+        # Google Books allows 100 requests per 100 seconds per key
+        self.buckets = {key: TokenBucket(rate=1.0, capacity=100) for key in api_keys}
+        # monotonic time until which each throttled key is left alone
+        self.cooldowns = {key: 0.0 for key in api_keys}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Release this client's hold on the shared session; it is closed once no client uses it."""
+        if self.shares_session:
+            self.shares_session = False
+            release_shared_session()
 
     def rotate_api_key(self):
-        """Rotate to the next API key."""
-        self.current_key_index = (self.current_key_index + 1) % len(self.api_keys)
-        print(f"Switching to API key index {self.current_key_index}")
+        """Rotate to the next API key that is not cooling off, or the one that recovers soonest."""
+        now = time.monotonic()
+        candidates = [(self.current_key_index + step) % len(self.api_keys) for step in range(1, len(self.api_keys) + 1)]
+        self.current_key_index = next(
+            (i for i in candidates if self.cooldowns[self.api_keys[i]] <= now),
+            min(candidates, key=lambda i: self.cooldowns[self.api_keys[i]])
+        )
+        logger.info("Switching to API key index %d", self.current_key_index)
 
     def get_current_api_key(self) -> str:
-        """Retrieve the current API key."""
+        """Retrieve the current API key, moving off it first if it is cooling off."""
+        if self.cooldowns[self.api_keys[self.current_key_index]] > time.monotonic():
+            self.rotate_api_key()
         return self.api_keys[self.current_key_index]
 
     def _api_request(self, params: Dict) -> Optional[requests.Response]:
@@ -29,39 +148,61 @@ class GoogleBooksAPI:
             # Skip adding the key parameter if None - allows public API access
             if current_key:
                 params["key"] = current_key
+            bucket = self.buckets[current_key]
+            bucket.consume()
             try:
-                response = requests.get(self.base_url, params=params)
+                response = self.session.get(self.base_url, params=params)
                 if response.status_code == 200:
+                    bucket.speed_up()
                     return response
-                elif response.status_code == 429:  # Rate-limited
-                    print(f"Rate limit reached. Retrying...")
+                if response.status_code == 429:  # Rate-limited
+                    logger.warning("Rate limit reached. Retrying...")
+                    bucket.slow_down()
+                    # bench the throttled key; full jitter keeps concurrent workers from retrying in lockstep
+                    retry_after = response.headers.get("Retry-After", "")
+                    cooldown = int(retry_after) if retry_after.isdigit() else random.uniform(0, min(delay, 30))
+                    self.cooldowns[current_key] = time.monotonic() + cooldown
                     if current_key:  # Only rotate if we have keys
                         self.rotate_api_key()
-                    time.sleep(delay)
-                    delay *= 2
+                    # only wait when every key is cooling off
+                    wait = self.cooldowns[self.api_keys[self.current_key_index]] - time.monotonic()
+                    if wait > 0:
+                        time.sleep(wait)
+                    delay = min(delay * 2, 60)
             except requests.RequestException as e:
-                print(f"Request error: {e}")
+                logger.error("Request error: %s", e)
         return None
 
     def search_books_randomly_with_pagination(self, max_results: int = 10, pages: int = 5) -> List[Dict]:
         """Fetch random books using random characters as queries and leverage pagination."""
         random_query = ''.join(random.choices(string.ascii_lowercase + string.digits, k=3))  # 3-character query
-        all_books = []
-        for start_index in range(0, pages * max_results, max_results):
-            params = {"q": random_query, "maxResults": max_results, "startIndex": start_index, "projection": "full"}
-            response = self._api_request(params)
-            if response:
-                items = response.json().get("items", [])
-                all_books.extend([self._parse_book_data(item) for item in items if item])
-        return all_books
+        start_indexes = range(0, pages * max_results, max_results)
+        # pages are independent, so fetch several at once; the per-key token buckets still pace the requests
+        with ThreadPoolExecutor(max_workers=min(pages, 10) or 1) as executor:
+            page_results = executor.map(
+                lambda start_index: self._fetch_search_page(random_query, max_results, start_index),
+                start_indexes
+            )
+            return [book for page in page_results for book in page]
+
+    def _fetch_search_page(self, query: str, max_results: int, start_index: int) -> List[Dict]:
+        """Fetch and parse a single page of search results."""
+        params = {"q": query, "maxResults": max_results, "startIndex": start_index, "projection": "full"}
+        response = self._api_request(params)
+        if not response:
+            return []
+        # the cached session has already read the whole body, so parse it in one pass
+        items = orjson.loads(response.content).get("items", [])
+        return [self._parse_book_data(item) for item in items if item]
 
     def fetch_book_data(self, isbn: str) -> Optional[Dict]:
         """Fetch detailed book data by ISBN."""
-        params = {"q": f"isbn:{isbn}", "projection": "full"}
+        # only the first match is parsed, so don't have the API send a full page
+        params = {"q": f"isbn:{isbn}", "maxResults": 1, "projection": "full"}
         response = self._api_request(params)
         if not response:
             return None
-        return self._parse_book_data(response.json().get("items", [{}])[0])
+        return self._parse_book_data((orjson.loads(response.content).get("items") or [None])[0])
 
     def _parse_book_data(self, item: Dict) -> Optional[Dict]:
         """Parse book data to extract required fields."""
@@ -70,61 +211,116 @@ class GoogleBooksAPI:
         volume_info = item.get("volumeInfo", {})
         sale_info = item.get("saleInfo", {})
         access_info = item.get("accessInfo", {})
+        # bind the lookups once; every field below is a get on one of these two dicts
+        vg = volume_info.get
+        sg = sale_info.get
+
+        list_price = sg("listPrice") or {}
+        retail_price = sg("retailPrice") or {}
 
         # Extract authors
-        authors = volume_info.get("authors", [])
+        authors = vg("authors", [])
         author_list = [{"name": author} for author in authors]
-        print(next((i["identifier"] for i in volume_info.get("industryIdentifiers", [])
-                    if i["type"] == "ISBN_13"), None))
+
+        # index the identifiers once instead of scanning the list per ISBN type
+        identifiers = {i["type"]: i["identifier"] for i in vg("industryIdentifiers", [])}
         return {
-            "title": volume_info.get("title"),
-            "subtitle": volume_info.get("subtitle"),
-            "description": volume_info.get("description"),
+            "title": vg("title"),
+            "subtitle": vg("subtitle"),
+            "description": vg("description"),
             "authors": author_list,
-            "publisher": volume_info.get("publisher"),
-            "published_year": volume_info.get("publishedDate", "").split("-")[0],
-            "isbn_10": next((i["identifier"] for i in volume_info.get("industryIdentifiers", [])
-                             if i["type"] == "ISBN_10"), None),
-            "isbn_13": next((i["identifier"] for i in volume_info.get("industryIdentifiers", [])
-                             if i["type"] == "ISBN_13"), None),
-            "page_count": volume_info.get("pageCount"),
-            "categories": volume_info.get("categories", []),
-            "language_code": volume_info.get("language"),
-            "maturity_rating": volume_info.get("maturityRating"),
-            "average_rating": volume_info.get("averageRating"),
-            "ratings_count": volume_info.get("ratingsCount"),
-            "physical_format": "Paperback" if not sale_info.get("isEbook", False) else "Hardcover",
+            "publisher": _intern(vg("publisher")),
+            "published_year": vg("publishedDate", "").split("-")[0],
+            "isbn_10": identifiers.get("ISBN_10"),
+            "isbn_13": identifiers.get("ISBN_13"),
+            "page_count": vg("pageCount"),
+            "categories": list(map(_intern, vg("categories", []))),
+            "language_code": vg("language"),
+            "maturity_rating": vg("maturityRating"),
+            "average_rating": vg("averageRating"),
+            "ratings_count": vg("ratingsCount"),
+            "physical_format": "Paperback" if not sg("isEbook", False) else "Hardcover",
             "price_info": {
-                "listPrice": sale_info.get("listPrice", {}).get("amount"),
-                "retailPrice": sale_info.get("retailPrice", {}).get("amount"),
-                "currency": sale_info.get("listPrice", {}).get("currencyCode"),
-                "saleability": sale_info.get("saleability"),
-                "buyLink": sale_info.get("buyLink"),
-                "onSaleDate": sale_info.get("onSaleDate"),
+                "listPrice": list_price.get("amount"),
+                "retailPrice": retail_price.get("amount"),
+                "currency": list_price.get("currencyCode"),
+                "saleability": sg("saleability"),
+                "buyLink": sg("buyLink"),
+                "onSaleDate": sg("onSaleDate"),
             },
-            "isEbook": sale_info.get("isEbook"),
+            "isEbook": sg("isEbook"),
             "google_books_id": item.get("id"),
-            "google_preview_link": volume_info.get("previewLink"),
-            "google_info_link": volume_info.get("infoLink"),
-            "google_canonical_link": volume_info.get("canonicalVolumeLink"),
+            "google_preview_link": vg("previewLink"),
+            "google_info_link": vg("infoLink"),
+            "google_canonical_link": vg("canonicalVolumeLink"),
         }
 
 class OpenLibraryAPI:
     """Handles Open Library API interactions with extended metadata parsing."""
 
-    def __init__(self):
+    def __init__(self, session: Optional[requests.Session] = None):
         self.base_url = "https://openlibrary.org"
+        # shares the process-wide session unless one is passed in, which stays owned by the caller
+        self.shares_session = session is None
+        self.session = session or get_shared_session()
+        # the same ISBN can come back in several result sets, so remember what OpenLibrary answered;
+        # only 200 responses are kept, so throttled or failed lookups are asked again next batch
+        self.cache: "OrderedDict[str, Optional[Dict]]" = OrderedDict()
+        self.cache_size = 4096
+        self.cache_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Release this client's hold on the shared session; it is closed once no client uses it."""
+        if self.shares_session:
+            self.shares_session = False
+            release_shared_session()
 
     def fetch_by_isbn(self, isbn: str) -> Optional[Dict]:
         """Fetch book data by ISBN from Open Library."""
+        return self.fetch_by_isbns([isbn]).get(isbn)
+
+    def fetch_by_isbns(self, isbns: List[str]) -> Dict[str, Dict]:
+        """Fetch book data for several ISBNs in a single request, keyed by ISBN."""
+        with self.cache_lock:
+            cached = {isbn: self.cache[isbn] for isbn in isbns if isbn in self.cache}
+            for isbn in cached:
+                self.cache.move_to_end(isbn)
+        missing = [isbn for isbn in isbns if isbn not in cached]
+        books = {isbn: book for isbn, book in cached.items() if book}
+        if not missing:
+            return books
+
         url = f"{self.base_url}/api/books"
-        params = {"bibkeys": f"ISBN:{isbn}", "format": "json", "jscmd": "data"}
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            book_data = response.json().get(f"ISBN:{isbn}")
-            if book_data:
-                return self._parse_book_data(book_data)
-        return None
+        params = {"bibkeys": ",".join(f"ISBN:{isbn}" for isbn in missing), "format": "json", "jscmd": "data"}
+        response = self.session.get(url, params=params)
+        if response.status_code != 200:
+            return books
+        failed = set()
+        for bibkey, book_data in orjson.loads(response.content).items():
+            if not book_data:
+                continue
+            # one malformed record shouldn't cost the rest of the request
+            try:
+                books[bibkey.split(":", 1)[1]] = self._parse_book_data(book_data)
+            except (AttributeError, IndexError, KeyError, TypeError) as e:
+                logger.warning("Skipping unparseable OpenLibrary record %s: %s", bibkey, e)
+                failed.add(bibkey.split(":", 1)[1])
+
+        # ISBNs OpenLibrary doesn't know are remembered as None so they aren't asked for again
+        with self.cache_lock:
+            for isbn in missing:
+                if isbn not in failed:
+                    self.cache[isbn] = books.get(isbn)
+                    self.cache.move_to_end(isbn)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return books
 
     def _parse_book_data(self, book_data: Dict) -> Dict:
         """Parse Open Library book data."""
@@ -146,9 +342,10 @@ class OpenLibraryAPI:
             "title": book_data.get("title"),
             "subtitle": book_data.get("subtitle"),
             "authors": author_details,
-            "publisher": book_data.get("publishers", [{}])[0].get("name"),
-            "published_year": book_data.get("publish_date", "").split()[-1],
+            "publisher": _intern((book_data.get("publishers") or [{}])[0].get("name")),
+            # the year is the last word of dates like "March 5, 2001"; editions may have no date at all
+            "published_year": "".join((book_data.get("publish_date") or "").split()[-1:]),
             "page_count": book_data.get("number_of_pages"),
-            "subjects": [subject.get("name") for subject in book_data.get("subjects", [])],
+            "subjects": [_intern(subject.get("name")) for subject in book_data.get("subjects", [])],
             "ebook_url": preview_url
         }
\ No newline at end of file
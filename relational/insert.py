@@ -1,202 +1,396 @@
+import csv
+import io
+import logging
+import math
 import psycopg2
-from typing import Dict, List, Optional, Union
-from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+from typing import Dict, List, Optional
+from datetime import date, datetime
+from operator import itemgetter
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+BOOK_COLUMNS = (
+    "isbn10", "isbn13", "title", "subtitle", "description",
+    "language_code", "publication_year", "page_count",
+    "maturity_rating", "google_books_id", "google_preview_link",
+    "google_info_link", "google_canonical_link"
+)
+
+# keys of a parsed book that feed BOOK_COLUMNS, in the same order
+BOOK_FIELDS = (
+    "isbn_10", "isbn_13", "title", "subtitle", "description",
+    "language_code", "published_year", "page_count",
+    "maturity_rating", "google_books_id", "google_preview_link",
+    "google_info_link", "google_canonical_link"
+)
+# the fetchers always set every key, so a single itemgetter replaces thirteen dict.get calls per row
+_get_book_fields = itemgetter(*BOOK_FIELDS)
+_BOOK_FIELD_DEFAULTS = dict.fromkeys(BOOK_FIELDS)
+
+# batches smaller than this skip the COPY staging table and use a multi-row INSERT;
+# a default pipeline batch (one page of 40 results) stays above it, so it goes through COPY
+COPY_THRESHOLD = 20
+
+# (entity table, link table, id column, name column width from ddl.sql, names of a book)
+# names wider than the column are dropped up front, since one would abort the whole batched upsert
+ENTITY_LINKS = (
+    ("Author", "BookAuthor", "author_id", 100,
+     lambda book: [author['name'] if isinstance(author, dict) else author for author in book.get("authors", []) if author]),
+    ("Publisher", "BookPublisher", "publisher_id", 200, lambda book: [book.get("publisher")]),
+    ("Category", "BookCategory", "category_id", 100, lambda book: book.get("categories", [])),
+    ("Subject", "BookSubject", "subject_id", 500, lambda book: book.get("subjects", [])),
+)
+
+# per-book statements that run once for every row, parsed and planned once per session
+PREPARED_STATEMENTS = {
+    "ins_rating": """
+        PREPARE ins_rating AS
+        INSERT INTO Ratings (book_id, avg_rating, ratings_count)
+        VALUES ($1, $2, $3)
+        ON CONFLICT (book_id) DO UPDATE 
+        SET avg_rating = EXCLUDED.avg_rating,
+            ratings_count = EXCLUDED.ratings_count;
+    """,
+    "ins_price": """
+        PREPARE ins_price AS
+        INSERT INTO Price (
+            book_id, country, on_sale_date, saleability,
+            list_price, retail_price,
+            list_price_currency_code, retail_price_currency_code,
+            buy_link
+        )
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+        ON CONFLICT (book_id, country, on_sale_date) DO UPDATE
+        SET list_price = EXCLUDED.list_price,
+            retail_price = EXCLUDED.retail_price
+        RETURNING price_id;
+    """,
+    "ins_ebook": """
+        PREPARE ins_ebook AS
+        INSERT INTO EBook (book_id, ebook_url)
+        VALUES ($1, $2)
+        ON CONFLICT (book_id) DO UPDATE
+        SET ebook_url = EXCLUDED.ebook_url;
+    """,
+    "ins_physical_book": """
+        PREPARE ins_physical_book AS
+        INSERT INTO PhysicalBook (book_id, format)
+        VALUES ($1, $2::format_type)
+        ON CONFLICT (book_id) DO UPDATE
+        SET format = EXCLUDED.format;
+    """,
+}
+
+class InsertConnection(psycopg2.extensions.connection):
+    """Connection that remembers whether the per-book statements were prepared on its session."""
+    statements_prepared = False
+
 def connect_to_db():
     """Establish a connection to the PostgreSQL database."""
     try:
         connection = psycopg2.connect(
+            connection_factory=InsertConnection,
             dbname=os.getenv("DB_NAME"),
             user=os.getenv("DB_USER"),
             password=os.getenv("DB_PASSWORD"),
             host=os.getenv("DB_HOST"),
             port=os.getenv("DB_PORT")
         )
-        print("Connected to the database.")
+        logger.info("Connected to the database.")
         return connection
     except psycopg2.Error as e:
-        print(f"Database connection error: {e}")
+        logger.error("Database connection error: %s", e)
         return None
 
-def format_year(year_str: str) -> Optional[int]:
-    """Format the year string to an integer if valid."""
-    if not year_str:
+def create_pool(minconn: int = 5, maxconn: int = 25) -> Optional[ThreadedConnectionPool]:
+    """Create a thread-safe pool of PostgreSQL connections."""
+    try:
+        pool = ThreadedConnectionPool(
+            minconn,
+            maxconn,
+            connection_factory=InsertConnection,
+            dbname=os.getenv("DB_NAME"),
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+            host=os.getenv("DB_HOST"),
+            port=os.getenv("DB_PORT")
+        )
+        logger.info("Created a pool of %d-%d database connections.", minconn, maxconn)
+        return pool
+    except psycopg2.Error as e:
+        logger.error("Database connection error: %s", e)
         return None
+
+@contextmanager
+def get_conn(pool: ThreadedConnectionPool):
+    """Check a connection out of the pool, committing on success and rolling back on error."""
+    connection = pool.getconn()
     try:
-        year = int(year_str.split('-')[0])
-        current_year = datetime.now().year
-        return year if 1400 <= year <= current_year else None
-    except ValueError:
+        yield connection
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        pool.putconn(connection)
+
+def prepare_statements(cursor) -> None:
+    """Prepare the per-book insert statements that this session doesn't have yet."""
+    # prepared statements outlive transactions, so each connection only pays for this once
+    if cursor.connection.statements_prepared:
+        return
+    cursor.execute("SELECT name FROM pg_prepared_statements;")
+    existing = {row[0] for row in cursor.fetchall()}
+    for name, statement in PREPARED_STATEMENTS.items():
+        if name not in existing:
+            cursor.execute(statement)
+    cursor.connection.statements_prepared = True
+
+def format_year(year_str: str, current_year: int) -> Optional[int]:
+    """Format the year string to an integer if valid."""
+    # only a four-digit year, alone or starting a YYYY-MM(-DD) date, can land in range;
+    # checking for that up front avoids the split and the try/except on every row
+    if not year_str or len(year_str) < 4 or year_str[4:5] not in ("", "-"):
+        return None
+    head = year_str[:4]
+    if not (head.isascii() and head.isdigit()):
+        return None
+    year = int(head)
+    return year if 1400 <= year <= current_year else None
+
+# same checks as the ISBN_TYPE10 / ISBN_TYPE13 domains, so a bad row can't abort the whole COPY
+def valid_isbn10(isbn: str) -> bool:
+    """Check an ISBN-10 without going through the regex engine."""
+    return len(isbn) == 10 and isbn.isascii() and isbn[:9].isdigit() and isbn[9] in "0123456789X"
+
+def valid_isbn13(isbn: str) -> bool:
+    """Check an ISBN-13 without going through the regex engine."""
+    return len(isbn) == 13 and isbn.isascii() and isbn.isdigit()
+
+# the other constrained Book columns, checked up front for the same reason
+def fit_text(value: Optional[str], max_length: int) -> Optional[str]:
+    """Return the value if it fits a VARCHAR(max_length) column, otherwise None."""
+    return value if value and len(value) <= max_length else None
+
+def fit_url(url: Optional[str]) -> Optional[str]:
+    """Return the URL if it satisfies the URL_TYPE domain, otherwise None."""
+    return url if url and len(url) <= 2048 and url.startswith(("http://", "https://")) else None
+
+def fit_language(code: Optional[str]) -> Optional[str]:
+    """Fit a language tag into language_code CHAR(3), keeping the primary subtag of e.g. "zh-CN"."""
+    if not code:
         return None
+    code = code.split("-", 1)[0]
+    return code if len(code) <= 3 else None
 
 def map_maturity_rating(rating: str) -> str:
     """Map the maturity rating to the database enum."""
     return 'MATURE' if rating == 'MATURE' else 'NOT_MATURE'
 
-def insert_publisher(cursor, publisher_name: str) -> Optional[int]:
-    """Insert a publisher into the database."""
-    if not publisher_name:
-        return None
+def upsert_names(cursor, table: str, id_column: str, max_length: int, names: List[str]) -> Dict[str, int]:
+    """Upsert every distinct name in a single statement and map each name to its ID."""
+    # sorted so concurrent batches lock shared names in the same order and can't deadlock
+    unique_names = sorted({name for name in names if name and len(name) <= max_length})
+    if not unique_names:
+        return {}
+    # DO UPDATE instead of DO NOTHING so names that already exist still come back with their IDs
+    rows = execute_values(cursor, f"""
+        INSERT INTO {table} (name)
+        VALUES %s
+        ON CONFLICT (name) DO UPDATE 
+        SET name = EXCLUDED.name
+        RETURNING name, {id_column};
+    """, [(name,) for name in unique_names], page_size=1000, fetch=True)
+    return dict(rows)
+
+def link_books(cursor, links: Dict[tuple, List[tuple]]) -> None:
+    """
+    Insert the (book_id, entity_id) pairs of every link table in one round trip.
+    links maps (link table, id column) to its pairs; each table gets a data-modifying CTE
+    that unnests the book and entity IDs as two parallel arrays.
+    """
+    statements, params = [], []
+    for (table, column), pairs in links.items():
+        if pairs:
+            statements.append(f"INSERT INTO {table} (book_id, {column}) "
+                              f"SELECT unnest(%s::int[]), unnest(%s::int[]) ON CONFLICT DO NOTHING")
+            book_ids, entity_ids = zip(*pairs)
+            params += [list(book_ids), list(entity_ids)]
+    if not statements:
+        return
+    *ctes, last = statements
+    with_clause = "WITH " + ", ".join(f"l{i} AS ({cte})" for i, cte in enumerate(ctes)) + " " if ctes else ""
+    cursor.execute(f"{with_clause}{last};", params)
+
+def upsert_all_names(cursor, books: List[Dict]) -> Dict[str, Dict[str, int]]:
+    """Upsert the authors, publishers, categories and subjects of all books, keyed by table."""
+    return {
+        table: upsert_names(cursor, table, id_column, max_length, [name for book in books for name in names_of(book)])
+        for table, _, id_column, max_length, names_of in ENTITY_LINKS
+    }
+
+def insert_entities(cursor, loaded_books: List[tuple], entity_ids: Optional[Dict[str, Dict[str, int]]] = None) -> None:
+    """
+    Link every loaded book to its authors, publishers, categories and subjects.
+    Names are upserted here unless entity_ids already maps them to IDs.
+    """
+    links = {}
+    for table, link_table, id_column, max_length, names_of in ENTITY_LINKS:
+        book_names = [(book_id, names_of(book)) for book_id, book in loaded_books]
+        if entity_ids is not None:
+            ids = entity_ids[table]
+        else:
+            ids = upsert_names(cursor, table, id_column, max_length, [name for _, names in book_names for name in names])
+        links[(link_table, id_column)] = [
+            (book_id, ids[name]) for book_id, names in book_names for name in names if name in ids
+        ]
+    link_books(cursor, links)
+
+def _book_fields(book_data: Dict) -> tuple:
+    """Pull the BOOK_FIELDS of a book in one call, treating missing keys as None."""
     try:
-        cursor.execute("""
-            INSERT INTO Publisher (name)
-            VALUES (%s)
-            ON CONFLICT (name) DO UPDATE 
-            SET name = EXCLUDED.name
-            RETURNING publisher_id;
-        """, (publisher_name,))
-        return cursor.fetchone()[0]
-    except Exception as e:
-        print(f"Error inserting publisher: {e}")
+        return _get_book_fields(book_data)
+    except KeyError:
+        return _get_book_fields({**_BOOK_FIELD_DEFAULTS, **book_data})
+
+def stage_book(book_data: Dict, current_year: int) -> Optional[tuple]:
+    """Build the Book row for a book, in BOOK_COLUMNS order. Returns None if the book is skipped."""
+    (isbn_10, isbn_13, title, subtitle, description, language_code, published_year,
+     page_count, maturity_rating, *google_fields) = _book_fields(book_data)
+    if not isbn_10 or not isbn_13:
+        logger.debug("Skipping book insertion due to missing ISBN: %s", book_data)
+        return None
+    if not valid_isbn10(isbn_10) or not valid_isbn13(isbn_13):
+        logger.debug("Skipping book insertion due to invalid ISBN: %s, %s", isbn_10, isbn_13)
+        return None
+    if not title:
+        logger.debug("Skipping book insertion due to missing title: %s", isbn_13)
+        return None
+    if len(title) > 500:
+        logger.debug("Skipping book insertion due to overlong title: %s", isbn_13)
         return None
 
-def insert_author(cursor, authors: List[Union[str, Dict]]) -> List[int]:
-    """Insert authors into the database and return their IDs."""
-    author_ids = []
-    for author in authors:
-        if not author:
-            continue
-        author_name = author['name'] if isinstance(author, dict) else author
-        try:
-            cursor.execute("""
-                INSERT INTO Author (name)
-                VALUES (%s)
-                ON CONFLICT (name) DO NOTHING
-                RETURNING author_id;
-            """, (author_name,))
-            result = cursor.fetchone()
-            if result:
-                author_ids.append(result[0])
-        except Exception as e:
-            print(f"Error inserting author {author_name}: {e}")
-    return author_ids
-
-def insert_category(cursor, categories: List[str]) -> List[int]:
-    """Insert categories into the database and return their IDs."""
-    category_ids = []
-    for category in categories:
-        if not category:
-            continue
-        try:
-            cursor.execute("""
-                INSERT INTO Category (name)
-                VALUES (%s)
-                ON CONFLICT (name) DO UPDATE 
-                SET name = EXCLUDED.name
-                RETURNING category_id;
-            """, (category,))
-            result = cursor.fetchone()
-            if result:
-                category_ids.append(result[0])
-        except Exception as e:
-            print(f"Error inserting category {category}: {e}")
-    return category_ids
-
-def insert_subject(cursor, subjects: List[str]) -> List[int]:
-    """Insert subjects into the database and return their IDs."""
-    subject_ids = []
-    for subject in subjects:
-        if not subject:
+    google_books_id, *google_links = google_fields
+    return (
+        isbn_10,
+        isbn_13,
+        title,
+        fit_text(subtitle, 500),
+        # csv COPY loads an empty field as NULL, so send NULL on the execute_values path too
+        description or None,
+        fit_language(language_code),
+        format_year(published_year, current_year),
+        page_count if isinstance(page_count, int) and page_count > 0 else None,
+        map_maturity_rating(maturity_rating),
+        fit_text(google_books_id, 50),
+        *map(fit_url, google_links),
+    )
+
+def copy_books(cursor, books: List[Dict], current_year: int) -> Dict[str, int]:
+    """
+    Bulk load books into Book, upserting on isbn13.
+    Large batches go through a single COPY into a staging table; below COPY_THRESHOLD rows
+    the temp table costs more than it saves, so the rows are sent with execute_values instead.
+    If the batch statement fails, the books are retried one at a time so only the bad one is lost.
+    Returns a mapping of isbn13 -> book_id for every book that was loaded.
+    """
+    rows = {}
+    for book in books:
+        # ON CONFLICT DO UPDATE can't touch the same row twice in one statement
+        if book.get("isbn_13") in rows:
             continue
-        try:
-            cursor.execute("""
-                INSERT INTO Subject (name)
-                VALUES (%s)
-                ON CONFLICT (name) DO UPDATE 
-                SET name = EXCLUDED.name
-                RETURNING subject_id;
-            """, (subject,))
-            result = cursor.fetchone()
-            if result:
-                subject_ids.append(result[0])
-        except Exception as e:
-            print(f"Error inserting subject {subject}: {e}")
-    return subject_ids
-
-def insert_book(cursor, book_data: Dict) -> Optional[int]:
-    """Insert or update a book with rating attributes directly in the Book table."""
-    
-    if not book_data.get("isbn_10") or not book_data.get("isbn_13"):
-        print(f"Skipping book insertion due to missing ISBN: {book_data}")
-        return None
-    
-    try:
-        # print(f"Inserting book: {book_data}")
-
-        cursor.execute("""
-            INSERT INTO Book (
-                isbn10, isbn13, title, subtitle, description,
-                language_code, publication_year, page_count,
-                maturity_rating, google_books_id, google_preview_link,
-                google_info_link, google_canonical_link
-            )
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (isbn13) WHERE isbn13 IS NOT NULL DO
-            UPDATE SET 
-                title = EXCLUDED.title,
-                subtitle = EXCLUDED.subtitle,
-                description = EXCLUDED.description
-            RETURNING book_id;
-        """, (
-            book_data.get("isbn_10"),
-            book_data.get("isbn_13"),
-            book_data.get("title"),
-            book_data.get("subtitle"),
-            book_data.get("description"),
-            book_data.get("language_code"),
-            format_year(book_data.get("published_year")),
-            book_data.get("page_count"),
-            map_maturity_rating(book_data.get("maturity_rating")),
-            book_data.get("google_books_id"),
-            book_data.get("google_preview_link"),
-            book_data.get("google_info_link"),
-            book_data.get("google_canonical_link"),
-        ))
+        row = stage_book(book, current_year)
+        if row:
+            rows[row[1]] = row
 
-        return cursor.fetchone()[0]
+    if not rows:
+        return {}
 
-    except Exception as e:
-        print(f"Error inserting book {book_data.get('title')}: {e}")
-        return None
+    # sorted by isbn13 so concurrent batches lock Book rows in the same order
+    rows = [rows[isbn] for isbn in sorted(rows)]
+    columns = ", ".join(BOOK_COLUMNS)
+    upsert = """
+        ON CONFLICT (isbn13) WHERE isbn13 IS NOT NULL DO
+        UPDATE SET 
+            title = EXCLUDED.title,
+            subtitle = EXCLUDED.subtitle,
+            description = EXCLUDED.description
+        RETURNING isbn13, book_id
+    """
+
+    insert = f"INSERT INTO Book ({columns}) VALUES %s {upsert}"
+
+    try:
+        cursor.execute("SAVEPOINT books;")
+        if len(rows) < COPY_THRESHOLD:
+            book_ids = dict(execute_values(cursor, insert, rows, page_size=len(rows), fetch=True))
+        else:
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            cursor.execute(f"""
+                CREATE TEMP TABLE book_stage ON COMMIT DROP AS
+                SELECT {columns} FROM Book WITH NO DATA;
+            """)
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY book_stage ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+            cursor.execute(f"""
+                INSERT INTO Book ({columns})
+                SELECT {columns} FROM book_stage
+                ORDER BY isbn13
+                {upsert};
+            """)
+            book_ids = dict(cursor.fetchall())
+        cursor.execute("RELEASE SAVEPOINT books;")
+        return book_ids
+    except psycopg2.extensions.TransactionRollbackError:
+        raise
+    except psycopg2.Error as e:
+        # a row the checks above couldn't catch (e.g. an isbn10 already on another book)
+        # fails the whole statement, so fall back to inserting row by row and skip just that book
+        cursor.execute("ROLLBACK TO SAVEPOINT books;")
+        logger.warning("Batch insert of %d books failed, retrying row by row: %s", len(rows), e)
+
+    book_ids = {}
+    for row in rows:
+        try:
+            cursor.execute("SAVEPOINT book;")
+            book_ids.update(execute_values(cursor, insert, [row], fetch=True))
+            cursor.execute("RELEASE SAVEPOINT book;")
+        except psycopg2.extensions.TransactionRollbackError:
+            raise
+        except psycopg2.Error as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT book;")
+            logger.error("Error inserting book %s: %s", row[1], e)
+    return book_ids
 
+# the per-book helpers log their own failures, but a deadlock is re-raised so the chunk is retried
 def insert_rating(cursor, book_id: int, avg_rating: float, ratings_count: int) -> None:
     """Insert or update a rating in the Ratings table."""
     try:
-        cursor.execute("""
-            INSERT INTO Ratings (book_id, avg_rating, ratings_count)
-            VALUES (%s, %s, %s)
-            ON CONFLICT (book_id) DO UPDATE 
-            SET avg_rating = EXCLUDED.avg_rating,
-                ratings_count = EXCLUDED.ratings_count;
-        """, (book_id, avg_rating, ratings_count))
+        cursor.execute("EXECUTE ins_rating (%s, %s, %s);", (book_id, avg_rating, ratings_count))
+    except psycopg2.extensions.TransactionRollbackError:
+        raise
     except Exception as e:
-        print(f"Error inserting rating for book {book_id}: {e}")
+        logger.error("Error inserting rating for book %s: %s", book_id, e)
 
-def insert_price(cursor, book_id: int, price_data: Dict) -> Optional[int]:
+def insert_price(cursor, book_id: int, price_data: Dict, today: date) -> Optional[int]:
     """Insert or update price data for a book."""
     if not price_data or not book_id:
         return None
     try:
-        cursor.execute("""
-            INSERT INTO Price (
-                book_id, country, on_sale_date, saleability,
-                list_price, retail_price,
-                list_price_currency_code, retail_price_currency_code,
-                buy_link
-            )
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (book_id, country, on_sale_date) DO UPDATE
-            SET list_price = EXCLUDED.list_price,
-                retail_price = EXCLUDED.retail_price
-            RETURNING price_id;
-        """, (
+        cursor.execute("EXECUTE ins_price (%s, %s, %s, %s, %s, %s, %s, %s, %s);", (
             book_id,
             price_data.get('country', 'USD'),
-            datetime.now().date(),
+            today,
             price_data.get('saleability'),
             price_data.get('listPrice'),
             price_data.get('retailPrice'),
@@ -205,89 +399,116 @@ def insert_price(cursor, book_id: int, price_data: Dict) -> Optional[int]:
             price_data.get('buyLink')
         ))
         return cursor.fetchone()[0]
+    except psycopg2.extensions.TransactionRollbackError:
+        raise
     except Exception as e:
-        print(f"Error inserting price: {e}")
+        logger.error("Error inserting price: %s", e)
         return None
 
 def handle_book_format(cursor, book_id: int, book_data: Dict):
     """Handle the book's format (PhysicalBook or EBook)."""
     try:
         if book_data.get("isEbook"):
-            cursor.execute("""
-                INSERT INTO EBook (book_id, ebook_url)
-                VALUES (%s, %s)
-                ON CONFLICT (book_id) DO UPDATE
-                SET ebook_url = EXCLUDED.ebook_url;
-            """, (book_id, book_data.get("ebook_url")))
+            cursor.execute("EXECUTE ins_ebook (%s, %s);", (book_id, book_data.get("ebook_url")))
         else:
             format_value = book_data.get("physical_format", "Hardcover").capitalize()
             if format_value not in ['Hardcover', 'Paperback']:
                 format_value = 'Hardcover'
-            cursor.execute("""
-                INSERT INTO PhysicalBook (book_id, format)
-                VALUES (%s, %s::format_type)
-                ON CONFLICT (book_id) DO UPDATE
-                SET format = EXCLUDED.format;
-            """, (book_id, format_value))
+            cursor.execute("EXECUTE ins_physical_book (%s, %s);", (book_id, format_value))
+    except psycopg2.extensions.TransactionRollbackError:
+        raise
     except Exception as e:
-        print(f"Error handling book format: {e}")
+        logger.error("Error handling book format: %s", e)
 
-def insert_data(connection, books: List[Dict]):
-    """Insert all book-related data into the database."""
-    with connection.cursor() as cursor:
-        for book in books:
+def insert_data(connection, books: List[Dict], entity_ids: Optional[Dict[str, Dict[str, int]]] = None):
+    """
+    Insert all book-related data into the database in a single transaction.
+    entity_ids can carry name -> ID maps from upsert_all_names so the names aren't upserted again.
+    """
+    # read the clock once per batch rather than once per row
+    now = datetime.now()
+    today = now.date()
+    with connection:
+        with connection.cursor() as cursor:
+            # a lost batch on crash is just re-fetched, so don't wait on the WAL flush at commit
+            cursor.execute("SET LOCAL synchronous_commit = OFF;")
+            prepare_statements(cursor)
+            book_ids = copy_books(cursor, books, now.year)
+            loaded_books = [(book_ids[book["isbn_13"]], book) for book in books if book.get("isbn_13") in book_ids]
+
+            # one upsert and one link insert per table for the whole batch
             try:
-                cursor.execute("BEGIN;")
-                book_id = insert_book(cursor, book)
-                if not book_id:
-                    cursor.execute("ROLLBACK;")
-                    continue
-
-                author_ids = insert_author(cursor, book.get("authors", []))
-                publisher_id = insert_publisher(cursor, book.get("publisher"))
-                category_ids = insert_category(cursor, book.get("categories", []))
-                subject_ids = insert_subject(cursor, book.get("subjects", []))
-
-                for author_id in author_ids:
-                    cursor.execute("""
-                        INSERT INTO BookAuthor (book_id, author_id)
-                        VALUES (%s, %s)
-                        ON CONFLICT DO NOTHING;
-                    """, (book_id, author_id))
-                if publisher_id:
-                    cursor.execute("""
-                        INSERT INTO BookPublisher (book_id, publisher_id)
-                        VALUES (%s, %s)
-                        ON CONFLICT DO NOTHING;
-                    """, (book_id, publisher_id))
-                for category_id in category_ids:
-                    cursor.execute("""
-                        INSERT INTO BookCategory (book_id, category_id)
-                        VALUES (%s, %s)
-                        ON CONFLICT DO NOTHING;
-                    """, (book_id, category_id))
-                for subject_id in subject_ids:
-                    cursor.execute("""
-                        INSERT INTO BookSubject (book_id, subject_id)
-                        VALUES (%s, %s)
-                        ON CONFLICT DO NOTHING;
-                    """, (book_id, subject_id))
-
-                handle_book_format(cursor, book_id, book)
-
-                if book.get("price_info"):
-                    insert_price(cursor, book_id, book["price_info"])
-
-                if book.get("average_rating") is not None:
-                    insert_rating(
-                        cursor,
-                        book_id,
-                        book.get("average_rating", 0.0),
-                        book.get("ratings_count", 0)
-                    )
-
-                cursor.execute("COMMIT;")
-                print(f"Successfully processed book: {book.get('title')}")
+                cursor.execute("SAVEPOINT entities;")
+                insert_entities(cursor, loaded_books, entity_ids)
+                cursor.execute("RELEASE SAVEPOINT entities;")
+            # a deadlock must reach _insert_chunk so the whole chunk is retried, not committed without links
+            except psycopg2.extensions.TransactionRollbackError:
+                raise
             except Exception as e:
-                cursor.execute("ROLLBACK;")
-                print(f"Error processing book {book.get('title')}: {e}")
+                cursor.execute("ROLLBACK TO SAVEPOINT entities;")
+                logger.error("Error inserting authors, publishers, categories and subjects: %s", e)
+
+            for book_id, book in loaded_books:
+                try:
+                    # savepoint keeps one bad book from aborting the rest of the batch
+                    cursor.execute("SAVEPOINT book;")
+
+                    handle_book_format(cursor, book_id, book)
+
+                    if book.get("price_info"):
+                        insert_price(cursor, book_id, book["price_info"], today)
+
+                    if book.get("average_rating") is not None:
+                        insert_rating(
+                            cursor,
+                            book_id,
+                            book.get("average_rating", 0.0),
+                            book.get("ratings_count", 0)
+                        )
+
+                    cursor.execute("RELEASE SAVEPOINT book;")
+                    logger.debug("Successfully processed book: %s", book.get('title'))
+                except psycopg2.extensions.TransactionRollbackError:
+                    raise
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO SAVEPOINT book;")
+                    logger.error("Error processing book %s: %s", book.get('title'), e)
+
+def _insert_chunk(pool: ThreadedConnectionPool, books: List[Dict], entity_ids: Optional[Dict[str, Dict[str, int]]], attempts: int = 3) -> None:
+    """Insert one chunk of books on its own pooled connection, retrying if it loses a deadlock."""
+    for attempt in range(1, attempts + 1):
+        try:
+            with get_conn(pool) as connection:
+                insert_data(connection, books, entity_ids)
+            return
+        # raised for both deadlocks and serialization failures; the transaction is already rolled back
+        except psycopg2.extensions.TransactionRollbackError as e:
+            if attempt == attempts:
+                raise
+            logger.warning("Retrying chunk of %d books after %s", len(books), e)
+            time.sleep(0.1 * attempt)
+
+def insert_data_parallel(pool: ThreadedConnectionPool, books: List[Dict], max_workers: int = 10, min_chunk_size: int = COPY_THRESHOLD):
+    """Split the books into chunks and insert them concurrently, one pooled connection per worker."""
+    # drop the books copy_books would reject, so their authors and subjects aren't left behind as orphans
+    current_year = datetime.now().year
+    books = [book for book in books if stage_book(book, current_year)]
+    if not books:
+        return
+
+    # names shared across chunks (the same author on many books) are upserted once, up front
+    try:
+        with get_conn(pool) as connection, connection.cursor() as cursor:
+            entity_ids = upsert_all_names(cursor, books)
+    except Exception as e:
+        logger.error("Error upserting names for the batch, falling back to per-chunk upserts: %s", e)
+        entity_ids = None
+
+    # spread the batch over the workers, but keep chunks big enough to go through COPY;
+    # smaller ones would spend more on their own transaction than they save in parallelism
+    chunk_size = max(min_chunk_size, math.ceil(len(books) / max_workers))
+    chunks = [books[i:i + chunk_size] for i in range(0, len(books), chunk_size)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_insert_chunk, pool, chunk, entity_ids) for chunk in chunks]
+        for future in futures:
+            future.result()
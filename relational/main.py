@@ -1,8 +1,9 @@
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict
 from fetch import GoogleBooksAPI, OpenLibraryAPI
-from insert import connect_to_db, insert_data
+from insert import create_pool, insert_data_parallel
 from dotenv import load_dotenv
 
 logging.basicConfig(level=logging.INFO)
@@ -16,7 +17,7 @@ class BookDataPipeline:
     def __init__(self):
         # load env variables + establish connections
         load_dotenv()
-        self.connection = connect_to_db()
+        self.pool = create_pool()
         
         # initialize API keys for rotation 
         self.api_keys = [
@@ -30,6 +31,9 @@ class BookDataPipeline:
         # initialize API clients
         self.google_books_api = GoogleBooksAPI(self.api_keys)
         self.open_library_api = OpenLibraryAPI()
+        # ISBNs per OpenLibrary bibkeys request, and concurrent requests per batch
+        self.isbns_per_request = 50
+        self.max_workers = 20
 
     def enrich_books(self, books: List[Dict]) -> List[Dict]:
         """
@@ -41,18 +45,33 @@ class BookDataPipeline:
         Returns:
             List of enriched book dictionaries
         """
-        enriched_books = []
-        for book in books:
-            if isbn13 := book.get("isbn_13"):  
-                try:
-                    openlib_data = self.open_library_api.fetch_by_isbn(isbn13)
-                    enriched_books.append({**book, **(openlib_data or {})})
-                except Exception as e:
-                    logger.error(f"Error enriching book {isbn13}: {e}")
-                    enriched_books.append(book)  
-            else:
-                enriched_books.append(book)
-        return enriched_books
+        # one bibkeys request covers a whole chunk of ISBNs; the chunks are fetched concurrently
+        isbns = list(dict.fromkeys(book["isbn_13"] for book in books if book.get("isbn_13")))
+        chunks = [isbns[i:i + self.isbns_per_request] for i in range(0, len(isbns), self.isbns_per_request)]
+        openlib_data = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for chunk_data in executor.map(self._fetch_openlib_chunk, chunks):
+                openlib_data.update(chunk_data)
+        logger.info("Enriched %d of %d books from OpenLibrary", len(openlib_data), len(books))
+        # OpenLibrary wins where it has a value; its empty fields must not blank out Google's
+        for isbn, openlib in openlib_data.items():
+            openlib_data[isbn] = {key: value for key, value in openlib.items() if value}
+        return [{**book, **openlib_data.get(book.get("isbn_13"), {})} for book in books]
+
+    def _fetch_openlib_chunk(self, isbns: List[str]) -> Dict[str, Dict]:
+        """
+        Fetches OpenLibrary data for a chunk of ISBNs.
+        
+        Args:
+            isbns: ISBN-13s to look up in one request
+        Returns:
+            OpenLibrary book data keyed by ISBN, empty if the request fails
+        """
+        try:
+            return self.open_library_api.fetch_by_isbns(isbns)
+        except Exception as e:
+            logger.error(f"Error enriching books {', '.join(isbns)}: {e}")
+            return {}
 
     def process_batch(self, max_results: int = 40, pages: int = 1) -> bool:
         """
@@ -80,7 +99,7 @@ class BookDataPipeline:
             # enrich with OpenLibrary data and store in database
             enriched_books = self.enrich_books(books)
             logger.info("Inserting enriched books into database...")
-            insert_data(self.connection, enriched_books)
+            insert_data_parallel(self.pool, enriched_books)
             logger.info(f"Successfully processed batch of {len(enriched_books)} books")
             return True
 
@@ -96,7 +115,7 @@ class BookDataPipeline:
         Args:
             batch_limit: Optional maximum number of batches to process
         """
-        if not self.connection:
+        if not self.pool:
             logger.error("Failed to connect to database")
             return
 
@@ -109,10 +128,14 @@ class BookDataPipeline:
         except KeyboardInterrupt:
             logger.info("Process stopped by user")
         finally:
-            # close db connection properly
-            if self.connection:
-                self.connection.close()
-                logger.info("Database connection closed")
+            # release the pooled HTTP connections
+            self.google_books_api.close()
+            self.open_library_api.close()
+
+            # close the pooled db connections properly
+            if self.pool:
+                self.pool.closeall()
+                logger.info("Database connections closed")
 
 def main():
     # create and run the pipeline